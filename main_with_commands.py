@@ -1,14 +1,18 @@
 import os
 import asyncio
+import hmac
 import logging
 from datetime import datetime, timedelta
+from functools import partial
 from flask import Flask, jsonify, request, render_template
 from dotenv import load_dotenv
-from telegram import Bot, Update
+from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
 from scraper import create_scraper
 from otp_filter import otp_filter
-from utils import format_otp_message, format_multiple_otps, get_status_message
+from utils import (OTPMsg, format_otp_message, format_multiple_otps, format_timestamp, get_status_message,
+                   RateLimiter, clean_phone_number, clean_service_name)
+import queue
 import threading
 import time
 
@@ -30,12 +34,30 @@ BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 GROUP_ID = os.getenv('TELEGRAM_GROUP_ID')
 IVASMS_EMAIL = os.getenv('IVASMS_EMAIL')
 IVASMS_PASSWORD = os.getenv('IVASMS_PASSWORD')
+IVASMS_EMAIL_MASKED = f"{(IVASMS_EMAIL or '')[:20]}..."
+
+# Optional push delivery instead of polling
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL')
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+IVASMS_WEBHOOK_SECRET = os.getenv('IVASMS_WEBHOOK_SECRET')
+
+if TELEGRAM_WEBHOOK_URL and not TELEGRAM_WEBHOOK_SECRET:
+    # An unauthenticated webhook would accept forged updates, so keep polling
+    logger.error("TELEGRAM_WEBHOOK_SECRET is required for webhook mode, falling back to polling")
+    TELEGRAM_WEBHOOK_URL = None
+
+# Adaptive polling: check quickly after new OTPs, back off while idle
+MIN_CHECK_INTERVAL = 15
+# Idle polls stay frequent enough that OTPs arrive before they expire
+MAX_CHECK_INTERVAL = int(os.getenv('MAX_CHECK_INTERVAL', '60'))
+CHECK_BACKOFF = 1.5
 
 # Bot statistics
 bot_stats = {
     'start_time': datetime.now(),
     'total_otps_sent': 0,
-    'last_check': 'Never',
+    'last_check': None,
+    'check_interval': MIN_CHECK_INTERVAL,
     'last_error': None,
     'is_running': False
 }
@@ -45,10 +67,73 @@ bot = None
 telegram_app = None
 scraper = None
 
+# Shared event loop for all Telegram I/O, running in its own thread
+event_loop = None
+
+# New OTPs waiting to be sent, drained in batches by the sender thread
+otp_queue = queue.Queue()
+SEND_BATCH_SIZE = 20
+SEND_BATCH_WAIT = 0.5
+sender_thread = None
+
+# Handle of the monitor coroutine running on the shared event loop
+monitor_future = None
+
+# Held while an OTP check runs so overlapping triggers coalesce
+check_lock = threading.Lock()
+
+# Telegram allows bots about 30 messages per second
+send_limiter = RateLimiter(rate=30)
+
+def start_event_loop():
+    """Start the shared asyncio event loop in a background thread"""
+    global event_loop
+    
+    if event_loop is None:
+        event_loop = asyncio.new_event_loop()
+        loop_thread = threading.Thread(target=event_loop.run_forever, daemon=True)
+        loop_thread.start()
+    
+    return event_loop
+
+def run_coroutine(coro, timeout=30):
+    """Run a coroutine on the shared event loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, start_event_loop()).result(timeout=timeout)
+
+# Status fields shared by commands and endpoints, recomputed at most every SNAPSHOT_TTL seconds
+SNAPSHOT_TTL = 2
+status_snapshot = {'ts': 0.0, 'data': None}
+
+def compute_snapshot():
+    """Compute the bot status fields shown by commands and endpoints"""
+    uptime = datetime.now() - bot_stats['start_time']
+    cache_stats = otp_filter.get_cache_stats()
+    
+    return {
+        'uptime': str(uptime).split('.')[0],  # Remove microseconds
+        'total_otps_sent': bot_stats['total_otps_sent'],
+        'last_check': format_timestamp(bot_stats['last_check']),
+        'last_error': bot_stats['last_error'],
+        'monitor_running': bot_stats['is_running'],
+        'check_interval': round(bot_stats['check_interval']),
+        'cache_size': cache_stats['total_cached'],
+        'expire_minutes': cache_stats['expire_minutes']
+    }
+
+def get_snapshot():
+    """Return the shared status snapshot, refreshing it when stale"""
+    now = time.time()
+    
+    if now - status_snapshot['ts'] > SNAPSHOT_TTL:
+        status_snapshot['data'] = compute_snapshot()
+        status_snapshot['ts'] = now
+    
+    return status_snapshot['data']
+
 # Telegram Command Handlers
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
-    welcome_message = """🤖 <b>Telegram OTP Bot</b>
+    welcome_message = f"""🤖 <b>Telegram OTP Bot</b>
 
 🎯 <b>Available Commands:</b>
 /start - Show this help message
@@ -64,7 +149,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Run 24/7 with automatic monitoring
 
 📊 <b>Current Status:</b>
-Bot is running and monitoring every 60 seconds.
+Bot is running and checking for OTPs every {MIN_CHECK_INTERVAL} to {MAX_CHECK_INTERVAL} seconds, faster while OTPs keep arriving.
 
 💡 <b>Need help?</b> Contact the bot administrator."""
 
@@ -72,32 +157,26 @@ Bot is running and monitoring every 60 seconds.
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /status command"""
-    uptime = datetime.now() - bot_stats['start_time']
-    uptime_str = str(uptime).split('.')[0]
-    
-    cache_stats = otp_filter.get_cache_stats()
-    
-    status_data = {
-        'uptime': uptime_str,
-        'total_otps_sent': bot_stats['total_otps_sent'],
-        'last_check': bot_stats['last_check'],
-        'cache_size': cache_stats['total_cached'],
-        'monitor_running': bot_stats['is_running']
-    }
-    
-    status_msg = get_status_message(status_data)
+    status_msg = get_status_message(get_snapshot())
     await update.message.reply_text(status_msg, parse_mode='HTML')
 
+CHECK_DONE_TEMPLATE = """✅ <b>OTP check completed!</b>
+
+Last check: {last_check}
+Total OTPs sent: {total_otps_sent}"""
+
 async def check_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /check command - manually check for OTPs"""
     await update.message.reply_text("🔍 <b>Checking for new OTPs...</b>", parse_mode='HTML')
     
     try:
-        check_and_send_otps()
+        # Scraping and sending block, so keep them off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, check_and_send_otps)
         await update.message.reply_text(
-            "✅ <b>OTP check completed!</b>\n\n"
-            f"Last check: {bot_stats['last_check']}\n"
-            f"Total OTPs sent: {bot_stats['total_otps_sent']}",
+            CHECK_DONE_TEMPLATE.format(
+                last_check=format_timestamp(bot_stats['last_check']),
+                total_otps_sent=bot_stats['total_otps_sent']
+            ),
             parse_mode='HTML'
         )
     except Exception as e:
@@ -108,13 +187,13 @@ async def check_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def test_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /test command - send test message"""
-    test_otp = {
-        'otp': '123456',
-        'phone': '+8801234567890',
-        'service': 'Test Service',
-        'timestamp': datetime.now().strftime('%H:%M:%S'),
-        'raw_message': 'This is a test OTP message from the bot'
-    }
+    test_otp = OTPMsg(
+        otp='123456',
+        phone='+8801234567890',
+        service='Test Service',
+        timestamp=time.strftime('%H:%M:%S'),
+        raw_message='This is a test OTP message from the bot'
+    )
     
     try:
         test_message = format_otp_message(test_otp)
@@ -133,37 +212,53 @@ async def test_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode='HTML'
         )
 
-async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /stats command - detailed statistics"""
-    uptime = datetime.now() - bot_stats['start_time']
-    uptime_str = str(uptime).split('.')[0]
-    
-    cache_stats = otp_filter.get_cache_stats()
-    
-    stats_message = f"""📊 <b>Detailed Bot Statistics</b>
+# /stats message template with the fields that never change already bound
+STATS_TEMPLATE = """📊 <b>Detailed Bot Statistics</b>
 
 ⏱️ <b>Runtime Information:</b>
-• Uptime: {uptime_str}
-• Started: {bot_stats['start_time'].strftime('%Y-%m-%d %H:%M:%S')}
-• Status: {'🟢 Running' if bot_stats['is_running'] else '🔴 Stopped'}
+• Uptime: {uptime}
+• Started: {started}
+• Status: {status}
 
 📨 <b>OTP Statistics:</b>
-• Total OTPs Sent: {bot_stats['total_otps_sent']}
-• Last Check: {bot_stats['last_check']}
-• Cache Size: {cache_stats['total_cached']} items
-• Cache Expiry: {cache_stats['expire_minutes']} minutes
+• Total OTPs Sent: {total_otps_sent}
+• Last Check: {last_check}
+• Cache Size: {cache_size} items
+• Cache Expiry: {expire_minutes} minutes
 
 🔧 <b>System Information:</b>
-• IVASMS Account: {IVASMS_EMAIL[:20]}...
-• Target Group: {GROUP_ID}
-• Check Interval: 60 seconds
-• Last Error: {bot_stats['last_error'] or 'None'}
+• IVASMS Account: {account}
+• Target Group: {group_id}
+• Check Interval: {check_interval} seconds
+• Last Error: {last_error}
 
 🌐 <b>Endpoints:</b>
 • Dashboard: Available
 • Manual Check: /check-otp
 • Status API: /status"""
 
+format_stats_message = partial(
+    STATS_TEMPLATE.format,
+    started=bot_stats['start_time'].strftime('%Y-%m-%d %H:%M:%S'),
+    account=IVASMS_EMAIL_MASKED,
+    group_id=GROUP_ID
+)
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /stats command - detailed statistics"""
+    snapshot = get_snapshot()
+    
+    stats_message = format_stats_message(
+        uptime=snapshot['uptime'],
+        status='🟢 Running' if snapshot['monitor_running'] else '🔴 Stopped',
+        total_otps_sent=snapshot['total_otps_sent'],
+        last_check=snapshot['last_check'],
+        cache_size=snapshot['cache_size'],
+        expire_minutes=snapshot['expire_minutes'],
+        check_interval=snapshot['check_interval'],
+        last_error=snapshot['last_error'] or 'None'
+    )
+
     await update.message.reply_text(stats_message, parse_mode='HTML')
 
 def initialize_bot():
@@ -180,12 +275,12 @@ def initialize_bot():
         if not IVASMS_EMAIL or not IVASMS_PASSWORD:
             raise ValueError("IVASMS credentials not found in environment variables")
         
-        # Initialize Telegram bot
-        bot = Bot(token=BOT_TOKEN)
-        
         # Initialize Telegram application with command handlers
         telegram_app = Application.builder().token(BOT_TOKEN).build()
         
+        # Reuse the application's bot so all sends share one connection pool
+        bot = telegram_app.bot
+        
         # Add command handlers
         telegram_app.add_handler(CommandHandler("start", start_command))
         telegram_app.add_handler(CommandHandler("status", status_command))
@@ -216,19 +311,12 @@ def send_telegram_message(message, parse_mode='HTML'):
             logger.error("Bot or Group ID not configured")
             return False
         
-        # Use asyncio to run the async function
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        async def send_message():
-            await bot.send_message(
-                chat_id=GROUP_ID,
-                text=message,
-                parse_mode=parse_mode
-            )
-        
-        loop.run_until_complete(send_message())
-        loop.close()
+        send_limiter.acquire()
+        run_coroutine(bot.send_message(
+            chat_id=GROUP_ID,
+            text=message,
+            parse_mode=parse_mode
+        ))
         
         logger.info("Message sent to Telegram successfully")
         return True
@@ -239,82 +327,144 @@ def send_telegram_message(message, parse_mode='HTML'):
         return False
 
 def check_and_send_otps():
-    """Check for new OTPs and send to Telegram"""
+    """Check for new OTPs and send to Telegram, returning how many were new"""
     global bot_stats
     
+    if not check_lock.acquire(blocking=False):
+        logger.info("OTP check already in progress")
+        return 0
+    
     try:
         if not scraper:
             logger.error("Scraper not initialized")
-            return
+            return 0
         
         # Fetch messages from IVASMS
         logger.info("Checking for new OTPs...")
         messages = scraper.fetch_messages()
-        bot_stats['last_check'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        if not messages:
-            logger.info("No messages found")
-            return
-        
-        # Filter out duplicates
-        new_messages = otp_filter.filter_new_otps(messages)
-        
-        if not new_messages:
-            logger.info("No new OTPs found (all were duplicates)")
-            return
-        
-        logger.info(f"Found {len(new_messages)} new OTPs")
-        
-        # Send messages to Telegram
-        if len(new_messages) == 1:
-            message = format_otp_message(new_messages[0])
-        else:
-            message = format_multiple_otps(new_messages)
-        
-        if send_telegram_message(message):
-            bot_stats['total_otps_sent'] += len(new_messages)
-            logger.info(f"Successfully sent {len(new_messages)} OTPs to Telegram")
-        else:
-            logger.error("Failed to send OTPs to Telegram")
+        bot_stats['last_check'] = time.time()
+        return queue_new_otps(messages)
         
     except Exception as e:
         logger.error(f"Error in check_and_send_otps: {e}")
         bot_stats['last_error'] = str(e)
+        return 0
+    
+    finally:
+        check_lock.release()
+
+def queue_new_otps(messages):
+    """Filter fetched messages and queue new OTPs for sending, returning how many were new"""
+    if not messages:
+        logger.info("No messages found")
+        return 0
+    
+    # Filter out duplicates
+    new_messages = otp_filter.filter_new_otps(messages)
+    
+    if not new_messages:
+        logger.info("No new OTPs found (all were duplicates)")
+        return 0
+    
+    logger.info(f"Found {len(new_messages)} new OTPs")
+    
+    # Hand off to the sender thread
+    for message_data in new_messages:
+        otp_queue.put(message_data)
+    
+    return len(new_messages)
+
+def otp_sender():
+    """Background thread sending queued OTPs to Telegram in batches"""
+    while True:
+        # Collect up to SEND_BATCH_SIZE OTPs arriving within SEND_BATCH_WAIT
+        batch = [otp_queue.get()]
+        deadline = time.monotonic() + SEND_BATCH_WAIT
+        
+        while len(batch) < SEND_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(otp_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        try:
+            message = format_multiple_otps(batch)
+            
+            if send_telegram_message(message):
+                bot_stats['total_otps_sent'] += len(batch)
+                logger.info(f"Successfully sent {len(batch)} OTPs to Telegram")
+            else:
+                logger.error("Failed to send OTPs to Telegram")
+        
+        except Exception as e:
+            logger.error(f"Error in OTP sender: {e}")
+            bot_stats['last_error'] = str(e)
 
-def background_monitor():
-    """Background thread to monitor for OTPs"""
-    global bot_stats
+def start_otp_sender():
+    """Start the OTP sender thread once"""
+    global sender_thread
     
+    if sender_thread is None:
+        sender_thread = threading.Thread(target=otp_sender, daemon=True)
+        sender_thread.start()
+
+async def monitor_loop():
+    """Monitor for OTPs on the shared event loop"""
     bot_stats['is_running'] = True
     logger.info("Background OTP monitor started")
     
+    interval = MIN_CHECK_INTERVAL
+    
     while bot_stats['is_running']:
         try:
-            check_and_send_otps()
-            # Wait 60 seconds before next check
-            time.sleep(60)
+            # Poll quickly right after a hit, back off while nothing arrives.
+            # The check runs in a worker thread, which holds check_lock for the whole scrape
+            if await asyncio.get_running_loop().run_in_executor(None, check_and_send_otps):
+                interval = MIN_CHECK_INTERVAL
+            else:
+                interval = min(interval * CHECK_BACKOFF, MAX_CHECK_INTERVAL)
+            
+            bot_stats['check_interval'] = interval
+            await asyncio.sleep(interval)
             
         except Exception as e:
             logger.error(f"Error in background monitor: {e}")
             bot_stats['last_error'] = str(e)
             # Wait longer on error
-            time.sleep(120)
+            await asyncio.sleep(120)
+
+def start_background_monitor():
+    """Schedule the OTP monitor on the shared event loop"""
+    global monitor_future
+    
+    monitor_future = asyncio.run_coroutine_threadsafe(monitor_loop(), start_event_loop())
 
 def start_telegram_bot():
-    """Start the Telegram bot in a separate thread"""
+    """Start receiving Telegram updates on the shared event loop"""
     if telegram_app:
         logger.info("Starting Telegram command handlers...")
         try:
-            # Run the bot in a separate thread
-            def run_bot():
-                asyncio.set_event_loop(asyncio.new_event_loop())
-                telegram_app.run_polling(drop_pending_updates=True)
+            async def run_bot():
+                await telegram_app.initialize()
+                await telegram_app.start()
+                
+                if TELEGRAM_WEBHOOK_URL:
+                    # Telegram pushes updates to /telegram/webhook on our Flask port
+                    await telegram_app.bot.set_webhook(
+                        url=f"{TELEGRAM_WEBHOOK_URL.rstrip('/')}/telegram/webhook",
+                        secret_token=TELEGRAM_WEBHOOK_SECRET,
+                        drop_pending_updates=True
+                    )
+                else:
+                    await telegram_app.updater.start_polling(drop_pending_updates=True)
             
-            bot_thread = threading.Thread(target=run_bot, daemon=True)
-            bot_thread.start()
-            logger.info("Telegram bot polling started")
+            run_coroutine(run_bot())
+            logger.info(f"Telegram bot {'webhook' if TELEGRAM_WEBHOOK_URL else 'polling'} started")
         except Exception as e:
-            logger.error(f"Failed to start Telegram bot polling: {e}")
+            logger.error(f"Failed to start Telegram bot: {e}")
 
 # Flask routes
 @app.route('/')
@@ -326,16 +476,15 @@ def home():
         return render_template('dashboard.html')
     
     # Serve JSON for API calls
-    uptime = datetime.now() - bot_stats['start_time']
-    uptime_str = str(uptime).split('.')[0]  # Remove microseconds
+    snapshot = get_snapshot()
     
     status = {
         'status': 'running',
-        'uptime': uptime_str,
-        'total_otps_sent': bot_stats['total_otps_sent'],
-        'last_check': bot_stats['last_check'],
-        'last_error': bot_stats['last_error'],
-        'monitor_running': bot_stats['is_running']
+        'uptime': snapshot['uptime'],
+        'total_otps_sent': snapshot['total_otps_sent'],
+        'last_check': snapshot['last_check'],
+        'last_error': snapshot['last_error'],
+        'monitor_running': snapshot['monitor_running']
     }
     
     return jsonify(status)
@@ -360,17 +509,14 @@ def manual_check():
 @app.route('/status')
 def bot_status():
     """Get detailed bot status"""
-    uptime = datetime.now() - bot_stats['start_time']
-    uptime_str = str(uptime).split('.')[0]
-    
-    cache_stats = otp_filter.get_cache_stats()
+    snapshot = get_snapshot()
     
     status = {
-        'uptime': uptime_str,
-        'total_otps_sent': bot_stats['total_otps_sent'],
-        'last_check': bot_stats['last_check'],
-        'cache_size': cache_stats['total_cached'],
-        'monitor_running': bot_stats['is_running']
+        'uptime': snapshot['uptime'],
+        'total_otps_sent': snapshot['total_otps_sent'],
+        'last_check': snapshot['last_check'],
+        'cache_size': snapshot['cache_size'],
+        'monitor_running': snapshot['monitor_running']
     }
     
     message = get_status_message(status)
@@ -401,6 +547,52 @@ def test_message():
     else:
         return jsonify({'status': 'error', 'message': 'Failed to send test message'}), 500
 
+@app.route('/telegram/webhook', methods=['POST'])
+def telegram_webhook():
+    """Receive Telegram updates when running in webhook mode"""
+    if not TELEGRAM_WEBHOOK_URL or not telegram_app:
+        return jsonify({'status': 'error', 'message': 'Endpoint not found'}), 404
+    
+    secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not TELEGRAM_WEBHOOK_SECRET or not hmac.compare_digest(secret, TELEGRAM_WEBHOOK_SECRET):
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+    
+    update = Update.de_json(request.get_json(force=True), telegram_app.bot)
+    run_coroutine(telegram_app.update_queue.put(update))
+    return jsonify({'status': 'success'})
+
+@app.route('/webhook/ivasms', methods=['POST'])
+def ivasms_webhook():
+    """Accept pushed SMS messages instead of waiting for the next poll"""
+    if not IVASMS_WEBHOOK_SECRET:
+        return jsonify({'status': 'error', 'message': 'Endpoint not found'}), 404
+    
+    secret = request.headers.get('X-Webhook-Secret', '')
+    if not hmac.compare_digest(secret, IVASMS_WEBHOOK_SECRET):
+        return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+    
+    payload = request.get_json(silent=True) or []
+    if isinstance(payload, dict):
+        payload = payload.get('messages', [payload])
+    if not isinstance(payload, list):
+        return jsonify({'status': 'error', 'message': 'Expected a list of messages'}), 400
+    
+    # Fields may arrive as numbers, so normalize them as strings
+    messages = [
+        OTPMsg(
+            otp=str(item['otp']),
+            phone=clean_phone_number(str(item.get('phone') or '')),
+            service=clean_service_name(str(item.get('service') or '')),
+            timestamp=str(item.get('timestamp') or time.strftime('%H:%M:%S')),
+            raw_message=str(item.get('raw_message') or '')
+        )
+        for item in payload
+        if isinstance(item, dict) and item.get('otp')
+    ]
+    
+    queued = queue_new_otps(messages)
+    return jsonify({'status': 'success', 'queued': queued})
+
 @app.route('/clear-cache')
 def clear_cache():
     """Clear OTP cache"""
@@ -419,8 +611,7 @@ def start_monitor():
         return jsonify({'status': 'info', 'message': 'Monitor already running'})
     
     try:
-        monitor_thread = threading.Thread(target=background_monitor, daemon=True)
-        monitor_thread.start()
+        start_background_monitor()
         return jsonify({'status': 'success', 'message': 'Background monitor started'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -431,6 +622,11 @@ def stop_monitor():
     global bot_stats
     
     bot_stats['is_running'] = False
+    
+    # Cancel the monitor's sleep instead of waiting for the next check
+    if monitor_future:
+        monitor_future.cancel()
+    
     return jsonify({'status': 'success', 'message': 'Background monitor stopped'})
 
 @app.errorhandler(404)
@@ -441,14 +637,14 @@ def not_found(error):
 def internal_error(error):
     return jsonify({'status': 'error', 'message': 'Internal server error'}), 500
 
-def main():
-    """Main function to start the bot"""
+def start_bot():
+    """Initialize the bot and start its background services"""
     logger.info("Starting Telegram OTP Bot...")
     
     # Initialize bot and scraper
     if not initialize_bot():
         logger.error("Failed to initialize bot. Check your configuration.")
-        return
+        return False
     
     # Start Telegram command handlers
     start_telegram_bot()
@@ -472,9 +668,23 @@ def main():
     
     send_telegram_message(startup_message)
     
+    # Start OTP sender
+    start_otp_sender()
+    
     # Start background monitor
-    monitor_thread = threading.Thread(target=background_monitor, daemon=True)
-    monitor_thread.start()
+    start_background_monitor()
+    
+    return True
+
+def create_app():
+    """WSGI entry point for production servers such as gunicorn"""
+    start_bot()
+    return app
+
+def main():
+    """Main function to start the bot with Flask's development server"""
+    if not start_bot():
+        return
     
     # Get port for deployment
     port = int(os.environ.get('PORT', 5000))
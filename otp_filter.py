@@ -1,98 +1,199 @@
-import json
-import os
-from datetime import datetime, timedelta
+import math
+import sqlite3
+import threading
+import time
+
+class BloomFilter:
+    """Fixed-size Bloom filter for fast negative membership checks"""
+    
+    def __init__(self, capacity=10000, error_rate=1e-4):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.count = 0
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+    
+    def _positions(self, key):
+        """Derive bit positions from the key's hash by double hashing"""
+        h = hash(key)
+        h1 = h & 0xFFFFFFFF
+        h2 = (h >> 32) | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+    
+    def add(self, key):
+        """Add key to the filter"""
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+    
+    def __contains__(self, key):
+        """False means key was never added; True may be a false positive"""
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
 
 class OTPFilter:
     """Manages OTP filtering to prevent duplicates"""
     
-    def __init__(self, cache_file='otp_cache.json', expire_minutes=30):
+    def __init__(self, cache_file='otp_cache.sqlite3', expire_minutes=30, cleanup_interval=30, max_size=500000,
+                 stats_ttl=5, bloom_capacity=10000, compact_ratio=0.3):
         self.cache_file = cache_file
         self.expire_minutes = expire_minutes
-        self.cache = self._load_cache()
-    
-    def _load_cache(self):
-        """Load existing cache from file"""
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'r') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, FileNotFoundError):
-                pass
-        return {}
-    
-    def _save_cache(self):
-        """Save cache to file"""
-        try:
-            with open(self.cache_file, 'w') as f:
-                json.dump(self.cache, f, indent=2)
-        except Exception as e:
-            print(f"Error saving cache: {e}")
+        self.cleanup_interval = cleanup_interval
+        self.max_size = max_size
+        self.stats_ttl = stats_ttl
+        self.bloom_capacity = bloom_capacity
+        self.compact_ratio = compact_ratio
+        self._last_cleanup = 0.0
+        self._stats_memo = (None, 0.0)
+        # Guards the connection across Flask, monitor and command threads
+        self._lock = threading.RLock()
+        self.conn = self._connect()
+        
+        # The Bloom filter only sees keys added by this process, so rows
+        # saved before startup must be looked up until they have expired
+        self._bloom = BloomFilter(self.bloom_capacity)
+        self._preloaded_until = self.conn.execute('SELECT MAX(expires_at) FROM otps').fetchone()[0] or 0.0
+    
+    def _connect(self):
+        """Open the cache database, creating its table if needed"""
+        conn = sqlite3.connect(self.cache_file, check_same_thread=False)
+        # Only takes effect for new databases; lets cleanup release free pages
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS otps ('
+            'otp TEXT, phone TEXT, service TEXT, ts REAL, expires_at REAL, '
+            'PRIMARY KEY (otp, phone, service))'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS otps_expires_at ON otps (expires_at)')
+        conn.commit()
+        return conn
     
     def _cleanup_expired(self):
-        """Remove expired entries from cache"""
-        current_time = datetime.now()
-        expired_keys = []
-        
-        for key, entry in self.cache.items():
-            try:
-                entry_time = datetime.fromisoformat(entry['timestamp'])
-                if current_time - entry_time > timedelta(minutes=self.expire_minutes):
-                    expired_keys.append(key)
-            except (KeyError, ValueError):
-                expired_keys.append(key)
-        
-        for key in expired_keys:
-            del self.cache[key]
+        """Remove expired entries from the cache"""
+        with self._lock:
+            with self.conn:
+                current_time = time.time()
+                deleted = self.conn.execute('DELETE FROM otps WHERE expires_at <= ?', (current_time,)).rowcount
+                
+                # Evict the oldest entries once the cache is full
+                total = self.conn.execute('SELECT COUNT(*) FROM otps').fetchone()[0]
+                if total > self.max_size:
+                    deleted += self.conn.execute(
+                        'DELETE FROM otps WHERE rowid IN (SELECT rowid FROM otps ORDER BY expires_at LIMIT ?)',
+                        (total - self.max_size,)
+                    ).rowcount
+                    total = self.max_size
+                
+                self._last_cleanup = current_time
+                
+                # Reclaim filter capacity once most tracked keys have expired
+                if total < self._bloom.count // 2:
+                    self._rebuild_bloom(total)
+            
+            if deleted and deleted > self.compact_ratio * (total + deleted):
+                self._compact()
+    
+    def _compact(self):
+        """Return free pages to the OS and truncate the write-ahead log"""
+        self.conn.execute('PRAGMA incremental_vacuum').fetchall()
+        self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+    
+    def _rebuild_bloom(self, total):
+        """Rebuild the Bloom filter from every key in the cache"""
+        bloom = BloomFilter(max(self.bloom_capacity, 2 * total))
+        for key in self.conn.execute('SELECT otp, phone, service FROM otps'):
+            bloom.add(key)
+        self._bloom = bloom
+        # Every stored key is now in the filter
+        self._preloaded_until = 0.0
+    
+    def _maybe_cleanup(self):
+        """Run cleanup unless it already ran within cleanup_interval seconds"""
+        if time.time() - self._last_cleanup >= self.cleanup_interval:
+            self._cleanup_expired()
     
     def _generate_key(self, otp_data):
         """Generate unique key for OTP entry"""
-        # Use OTP code + phone number as unique identifier
-        otp = otp_data.get('otp', '')
-        phone = otp_data.get('phone', '')
-        service = otp_data.get('service', '')
-        return f"{otp}_{phone}_{service}"
+        # Use OTP code + phone number + service as unique identifier
+        if isinstance(otp_data, dict):
+            return (otp_data.get('otp', ''), otp_data.get('phone', ''), otp_data.get('service', ''))
+        # Messages carry the key computed when they were extracted
+        return otp_data.key
     
     def is_duplicate(self, otp_data):
         """Check if OTP has been processed recently"""
-        self._cleanup_expired()
         key = self._generate_key(otp_data)
-        return key in self.cache
+        now = time.time()
+        # Most new OTPs are rejected here without touching the database
+        if key not in self._bloom and now >= self._preloaded_until:
+            return False
+        
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT 1 FROM otps WHERE otp = ? AND phone = ? AND service = ? AND expires_at > ?',
+                (*key, now)
+            ).fetchone()
+        return row is not None
+    
+    def _insert(self, otp_data):
+        """Insert OTP into the cache without committing"""
+        key = self._generate_key(otp_data)
+        now = time.time()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO otps (otp, phone, service, ts, expires_at) VALUES (?, ?, ?, ?, ?)',
+            (*key, now, now + self.expire_minutes * 60)
+        )
+        
+        if self._bloom.count >= self._bloom.capacity:
+            self._rebuild_bloom(self._bloom.count)
+        self._bloom.add(key)
     
     def add_otp(self, otp_data):
         """Add OTP to cache to mark as processed"""
-        key = self._generate_key(otp_data)
-        self.cache[key] = {
-            'timestamp': datetime.now().isoformat(),
-            'otp': otp_data.get('otp', ''),
-            'phone': otp_data.get('phone', ''),
-            'service': otp_data.get('service', '')
-        }
-        self._save_cache()
+        with self._lock, self.conn:
+            self._insert(otp_data)
     
     def filter_new_otps(self, otp_list):
         """Filter out duplicate OTPs from a list"""
         new_otps = []
         
-        for otp_data in otp_list:
-            if not self.is_duplicate(otp_data):
-                new_otps.append(otp_data)
-                self.add_otp(otp_data)
+        with self._lock:
+            self._maybe_cleanup()
+            
+            # Commit the whole batch in a single transaction
+            with self.conn:
+                for otp_data in otp_list:
+                    if not self.is_duplicate(otp_data):
+                        new_otps.append(otp_data)
+                        self._insert(otp_data)
         
         return new_otps
     
     def get_cache_stats(self):
-        """Get statistics about cached OTPs"""
-        self._cleanup_expired()
-        return {
-            'total_cached': len(self.cache),
-            'cache_file': self.cache_file,
-            'expire_minutes': self.expire_minutes
-        }
+        """Get statistics about cached OTPs, reused for stats_ttl seconds"""
+        stats, expires_at = self._stats_memo
+        now = time.time()
+        
+        if stats is None or now >= expires_at:
+            with self._lock:
+                total = self.conn.execute('SELECT COUNT(*) FROM otps WHERE expires_at > ?', (now,)).fetchone()[0]
+            stats = {
+                'total_cached': total,
+                'cache_file': self.cache_file,
+                'expire_minutes': self.expire_minutes
+            }
+            self._stats_memo = (stats, now + self.stats_ttl)
+        
+        return stats
     
     def clear_cache(self):
         """Clear all cached OTPs"""
-        self.cache = {}
-        self._save_cache()
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM otps')
+            self._rebuild_bloom(0)
+            self._stats_memo = (None, 0.0)
         return "Cache cleared successfully"
 
 # Global filter instance
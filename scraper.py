@@ -1,9 +1,63 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
+import logging
 import time
 import re
+import threading
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from utils import extract_otp_from_text, clean_phone_number, clean_service_name
+from utils import OTPMsg, extract_otp_from_text, clean_phone_number, clean_service_name
+
+# Services recognised in page text
+SERVICES = ['facebook', 'google', 'instagram', 'twitter', 'whatsapp', 'telegram', 'discord']
+
+_PHONE_RE = re.compile(r'\+?\d{10,15}')
+# All service names in one alternation, so a context is scanned once
+_SERVICE_RE = re.compile('|'.join(SERVICES), re.I)
+# Phone, service and time fields in one pass; lastgroup names the match
+_FIELD_RE = re.compile(
+    r'(?P<phone>\+?\d{10,15})'
+    rf'|(?P<service>{_SERVICE_RE.pattern})'
+    r'|(?P<time>\d{1,2}:\d{2})',
+    re.I
+)
+_OTP_FIND_RE = re.compile(r'\b\d{4,6}\b')
+logger = logging.getLogger(__name__)
+
+# Largest message page body that will be parsed
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+# Bytes handed to the HTML parser at a time while a page downloads
+PAGE_CHUNK_SIZE = 8192
+# <meta charset=...> or <meta http-equiv="Content-Type" content="...; charset=...">
+_META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=', re.I)
+# Returned by probes that were redirected to the login page
+LOGIN_REQUIRED = object()
+
+# Common paths for SMS/message history
+MESSAGE_PATHS = [
+    '/messages',
+    '/sms',
+    '/live/my_sms',
+    '/sms/received',
+    '/account',
+    '/numbers'
+]
+
+_LOGIN_KEYWORDS = ('dashboard', 'account', 'logout')
+# Compiled XPath for the table and div walks
+_TABLES_XPATH = etree.XPath('//table')
+_ROWS_XPATH = etree.XPath('.//tr')
+_CELLS_XPATH = etree.XPath('.//td | .//th')
+# Divs whose class mentions a message, case-insensitively
+_LOWER_CLASS = "translate(@class, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')"
+_MESSAGE_DIVS_XPATH = etree.XPath(
+    f"//div[contains({_LOWER_CLASS}, 'message') or contains({_LOWER_CLASS}, 'sms') or contains({_LOWER_CLASS}, 'otp')]"
+)
 
 class IVASMSScraper:
     """Scraper for IVASMS.com to fetch OTPs and messages"""
@@ -12,8 +66,19 @@ class IVASMSScraper:
         self.email = email
         self.password = password
         self.session = requests.Session()
+        # Keep connections to IVASMS alive across polls and retry transient errors
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+        )
+        self.session.mount('https://', adapter)
         self.base_url = "https://www.ivasms.com"
         self.is_logged_in = False
+        # Page that last yielded messages, reused until it stops loading
+        self._messages_path = None
+        # Long-lived workers for probing message paths in parallel
+        self._executor = ThreadPoolExecutor(max_workers=len(MESSAGE_PATHS), thread_name_prefix='ivasms-probe')
         
         # Set headers to mimic a real browser
         self.session.headers.update({
@@ -37,7 +102,7 @@ class IVASMSScraper:
                 print(f"Failed to access login page. Status: {response.status_code}")
                 return False
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = BeautifulSoup(response.content, 'lxml')
             
             # Find CSRF token if present
             csrf_token = None
@@ -66,8 +131,8 @@ class IVASMSScraper:
                     return True
                 
                 # Check page content for login success indicators
-                soup = BeautifulSoup(login_response.content, 'html.parser')
-                if soup.find(text=re.compile(r'dashboard|account|logout', re.I)):
+                soup = BeautifulSoup(login_response.content, 'lxml')
+                if soup.find(string=lambda text: text and any(k in text.lower() for k in _LOGIN_KEYWORDS)):
                     self.is_logged_in = True
                     print("Successfully logged in to IVASMS")
                     return True
@@ -86,39 +151,26 @@ class IVASMSScraper:
                 return []
         
         try:
-            # Common paths for SMS/message history
-            possible_paths = [
-                '/messages',
-                '/sms',
-                '/live/my_sms',
-                '/sms/received',
-                '/account',
-                '/numbers'
-            ]
-            
-            messages = []
+            if self._messages_path:
+                page = self._fetch_path(self._messages_path)
+                if page is not None:
+                    messages, structured = page
+                    if structured:
+                        return messages
+                # The known page stopped loading or has no message rows, so look again
+                self._messages_path = None
             
-            for path in possible_paths:
-                try:
-                    url = f"{self.base_url}{path}"
-                    response = self.session.get(url)
-                    
-                    if response.status_code == 200:
-                        soup = BeautifulSoup(response.content, 'html.parser')
-                        page_messages = self._extract_messages_from_page(soup)
-                        if page_messages:
-                            messages.extend(page_messages)
-                            print(f"Found {len(page_messages)} messages on {path}")
-                            break
-                except Exception as e:
-                    continue
+            messages = self._discover_messages()
+            if not messages and not self.is_logged_in:
+                # A probe was sent back to the login page
+                if not self.login():
+                    return []
+                messages = self._discover_messages()
             
             if not messages:
-                # Try to find any SMS-like content on the main page
-                dashboard_response = self.session.get(f"{self.base_url}/dashboard")
-                if dashboard_response.status_code == 200:
-                    soup = BeautifulSoup(dashboard_response.content, 'html.parser')
-                    messages = self._extract_messages_from_page(soup)
+                # Try to find any SMS-like content on the main page, without caching it
+                page = self._fetch_path('/dashboard')
+                messages = page[0] if page else []
             
             return messages
             
@@ -126,133 +178,274 @@ class IVASMSScraper:
             print(f"Error fetching messages: {e}")
             return []
     
-    def _extract_messages_from_page(self, soup):
-        """Extract message data from a BeautifulSoup page object"""
+    def _fetch_path(self, path, relogin=True, abort=None):
+        """Fetch a page and extract (messages, structured), or None if it didn't load"""
+        url = f"{self.base_url}{path}"
+        response, root = self._get_page(url, abort)
+        
+        if self._session_expired(response):
+            if not relogin:
+                # Let the caller decide whether the whole session has expired
+                return LOGIN_REQUIRED
+            self.is_logged_in = False
+            # Log in again on the same pooled session and retry
+            if not self.login():
+                return None
+            response, root = self._get_page(url)
+        
+        if root is None:
+            return None
+        
+        return self._extract_messages_from_page(root)
+    
+    def _get_page(self, url, abort=None):
+        """GET and parse a page, or None if it failed, exceeds MAX_PAGE_BYTES or was aborted"""
+        with self.session.get(url, stream=True) as response:
+            if response.status_code != 200:
+                return response, None
+            
+            # Skip oversized pages before downloading them when the size is known
+            length = response.headers.get('Content-Length', '')
+            if length.isdigit() and int(length) > MAX_PAGE_BYTES:
+                print(f"Skipping {url}: {length} bytes exceeds {MAX_PAGE_BYTES}")
+                return response, None
+            
+            # Parse chunks as they arrive so parsing overlaps the download
+            charset = 'charset=' in response.headers.get('Content-Type', '').lower()
+            parser = None
+            received = 0
+            for chunk in response.iter_content(PAGE_CHUNK_SIZE):
+                # Stop downloading once the result is no longer wanted
+                if abort is not None and abort.is_set():
+                    return response, None
+                # Sizes are counted after decompression
+                received += len(chunk)
+                if received > MAX_PAGE_BYTES:
+                    print(f"Skipping {url}: body exceeds {MAX_PAGE_BYTES} bytes")
+                    return response, None
+                if parser is None:
+                    parser = lxml.html.HTMLParser(encoding=self._page_encoding(response, charset, chunk))
+                parser.feed(chunk)
+            
+            if parser is None:
+                return response, None  # Empty document
+            
+            try:
+                return response, parser.close()
+            except etree.XMLSyntaxError:
+                return response, None  # Empty document
+    
+    def _page_encoding(self, response, charset, first_chunk):
+        """Pick the parser encoding: the header charset, the page's meta charset, else UTF-8"""
+        if charset:
+            return response.encoding
+        if _META_CHARSET_RE.search(first_chunk):
+            # lxml follows the declared meta charset itself
+            return None
+        return 'utf-8'
+    
+    def _discover_messages(self):
+        """Probe all message paths at once and keep the first one, in MESSAGE_PATHS order, with message rows"""
+        # Probes never log in themselves so expiry triggers a single login
+        abort = threading.Event()
+        futures = [(path, self._executor.submit(self._fetch_path, path, False, abort)) for path in MESSAGE_PATHS]
+        redirected = 0
+        fallback = []
+        try:
+            # Wait in priority order so a fast low-priority page can't win
+            for path, future in futures:
+                try:
+                    page = future.result()
+                except Exception:
+                    continue
+                
+                if page is LOGIN_REQUIRED:
+                    redirected += 1
+                    continue
+                if page is None:
+                    continue
+                
+                page_messages, structured = page
+                if page_messages and structured:
+                    # Only pages with real message rows are worth remembering
+                    self._messages_path = path
+                    print(f"Found {len(page_messages)} messages on {path}")
+                    return page_messages
+                if page_messages and not fallback:
+                    fallback = page_messages
+        finally:
+            # Probes still downloading stop at their next chunk
+            abort.set()
+        
+        # Only treat the session as expired if every probe was sent to login
+        if redirected == len(futures):
+            self.is_logged_in = False
+        
+        # Free-text matches are used for this poll only
+        return fallback
+    
+    def _session_expired(self, response):
+        """Check if a request was redirected back to the login page"""
+        return response.url.rstrip('/').endswith('/login')
+    
+    def _extract_messages_from_page(self, root):
+        """Extract message data from a parsed lxml page as (messages, structured)"""
         messages = []
         
         try:
+            # Messages without a time of their own share the page's fetch time
+            default_ts = datetime.now().strftime('%H:%M:%S')
+            
             # Look for common table/list structures containing SMS data
             # Try different selectors that might contain SMS messages
             
             # Method 1: Look for tables with SMS data
-            tables = soup.find_all('table')
+            tables = _TABLES_XPATH(root)
             for table in tables:
-                rows = table.find_all('tr')[1:]  # Skip header row
+                rows = _ROWS_XPATH(table)[1:]  # Skip header row
                 for row in rows:
-                    cells = row.find_all(['td', 'th'])
+                    cells = _CELLS_XPATH(row)
                     if len(cells) >= 3:  # Minimum columns for phone, service, message
-                        message_data = self._extract_message_from_row(cells)
+                        message_data = self._extract_message_from_row(cells, default_ts)
                         if message_data:
                             messages.append(message_data)
             
             # Method 2: Look for div containers with message data
-            message_divs = soup.find_all('div', class_=re.compile(r'message|sms|otp', re.I))
+            message_divs = _MESSAGE_DIVS_XPATH(root)
             for div in message_divs:
-                message_data = self._extract_message_from_div(div)
+                message_data = self._extract_message_from_div(div, default_ts)
                 if message_data:
                     messages.append(message_data)
             
+            # Structured matches are more reliable than the free-text scan
+            if messages:
+                return messages, True
+            
             # Method 3: Look for any text that looks like OTP messages
-            text_content = soup.get_text()
-            potential_otps = re.findall(r'\b\d{4,6}\b', text_content)
-            if potential_otps:
-                # Try to extract context around OTPs
-                for otp in potential_otps[:5]:  # Limit to first 5 to avoid spam
-                    message_data = {
-                        'otp': otp,
-                        'phone': self._extract_phone_from_context(text_content, otp),
-                        'service': self._extract_service_from_context(text_content, otp),
-                        'timestamp': datetime.now().strftime('%H:%M:%S'),
-                        'raw_message': f"OTP: {otp}"
-                    }
-                    messages.append(message_data)
+            etree.strip_elements(root, 'script', 'style', with_tail=False)
+            messages.extend(self._extract_from_text(root.itertext(), default_ts))
             
-        except Exception as e:
-            print(f"Error extracting messages from page: {e}")
+        except Exception:
+            # One handler for the whole page; row and div helpers don't catch
+            logger.exception("Error extracting messages from page")
+        
+        return messages, False
+    
+    def _extract_from_text(self, texts, default_ts, limit=5, context=100):
+        """Yield OTP-like numbers from a page's text nodes in a single pass"""
+        window = ""  # Text just before the current node
+        pending = []  # [otp, text before, text after] awaiting trailing context
+        found = 0
         
-        return messages
+        # A final None flushes OTPs still waiting for trailing context
+        for text in chain(texts, [None]):
+            if text is not None:
+                for entry in pending:
+                    entry[2] += text
+                for match in _OTP_FIND_RE.finditer(text):
+                    before = (window + text[:match.start()])[-context:]
+                    pending.append([match.group(), before, text[match.end():]])
+                window = (window + text)[-context:]
+            
+            # Emit OTPs once their surrounding context is complete
+            while pending and (text is None or len(pending[0][2]) >= context):
+                otp, before, after = pending.pop(0)
+                text_content = before + otp + after[:context]
+                yield OTPMsg(
+                    otp=otp,
+                    phone=self._extract_phone_from_context(text_content, otp),
+                    service=self._extract_service_from_context(text_content, otp),
+                    timestamp=default_ts,
+                    raw_message=f"OTP: {otp}"
+                )
+                found += 1
+                if found >= limit:  # Limit to avoid spam
+                    return
     
-    def _extract_message_from_row(self, cells):
+    def _extract_message_from_row(self, cells, default_ts):
         """Extract message data from table row cells"""
-        try:
-            if len(cells) < 3:
-                return None
+        if len(cells) < 3:
+            return None
+        
+        # Common table structures:
+        # [Phone, Service, Message, Time] or [Time, Phone, Service, Message]
+        
+        phone = ""
+        service = ""
+        timestamp = default_ts
+        candidates = []
+        
+        # Try to identify columns based on content
+        for cell in cells:
+            cell_text = cell.text_content().strip()
             
-            # Common table structures:
-            # [Phone, Service, Message, Time] or [Time, Phone, Service, Message]
+            fields = set()
+            for match in _FIELD_RE.finditer(cell_text):
+                fields.add(match.lastgroup)
+                if match.lastgroup == 'phone':
+                    break
             
-            phone = ""
-            service = ""
-            message = ""
-            timestamp = datetime.now().strftime('%H:%M:%S')
+            # Phone number detection
+            if 'phone' in fields:
+                phone = clean_phone_number(cell_text)
             
-            # Try to identify columns based on content
-            for cell in cells:
-                cell_text = cell.get_text(strip=True)
-                
-                # Phone number detection
-                if re.search(r'\+?\d{10,15}', cell_text):
-                    phone = clean_phone_number(cell_text)
-                
-                # Service name detection
-                elif re.search(r'facebook|google|instagram|twitter|whatsapp|telegram|discord', cell_text, re.I):
-                    service = clean_service_name(cell_text)
-                
-                # Message content (usually longest text)
-                elif len(cell_text) > 20:
-                    message = cell_text
-                
-                # Time detection
-                elif re.search(r'\d{1,2}:\d{2}', cell_text):
-                    timestamp = cell_text
+            # Service name detection
+            elif 'service' in fields:
+                service = clean_service_name(cell_text)
             
-            # Extract OTP from message
-            otp = extract_otp_from_text(message)
+            # Message content candidates
+            elif len(cell_text) > 20:
+                candidates.append(cell_text)
             
-            if otp:
-                return {
-                    'otp': otp,
-                    'phone': phone or "N/A",
-                    'service': service or "Unknown",
-                    'timestamp': timestamp,
-                    'raw_message': message
-                }
+            # Time detection
+            elif 'time' in fields:
+                timestamp = cell_text
         
-        except Exception as e:
-            print(f"Error extracting from row: {e}")
+        # Message content (usually longest text)
+        message = max(candidates, key=len, default="")
+        
+        # Extract OTP from message
+        otp = extract_otp_from_text(message)
+        
+        if otp:
+            return OTPMsg(
+                otp=otp,
+                phone=phone or "N/A",
+                service=service or "Unknown",
+                timestamp=timestamp,
+                raw_message=message
+            )
         
         return None
     
-    def _extract_message_from_div(self, div):
+    def _extract_message_from_div(self, div, default_ts):
         """Extract message data from div container"""
-        try:
-            text = div.get_text(strip=True)
-            
-            # Extract OTP
-            otp = extract_otp_from_text(text)
-            if not otp:
-                return None
-            
-            # Extract phone
-            phone_match = re.search(r'\+?\d{10,15}', text)
-            phone = clean_phone_number(phone_match.group()) if phone_match else "N/A"
-            
-            # Extract service
-            service_match = re.search(r'(facebook|google|instagram|twitter|whatsapp|telegram|discord)', text, re.I)
-            service = clean_service_name(service_match.group()) if service_match else "Unknown"
-            
-            return {
-                'otp': otp,
-                'phone': phone,
-                'service': service,
-                'timestamp': datetime.now().strftime('%H:%M:%S'),
-                'raw_message': text
-            }
+        text = div.text_content().strip()
         
-        except Exception as e:
-            print(f"Error extracting from div: {e}")
+        # Extract OTP
+        otp = extract_otp_from_text(text)
+        if not otp:
+            return None
         
-        return None
+        # Extract the first phone and service in a single scan
+        phone = service = None
+        for match in _FIELD_RE.finditer(text):
+            if match.lastgroup == 'phone' and phone is None:
+                phone = clean_phone_number(match.group())
+            elif match.lastgroup == 'service' and service is None:
+                service = clean_service_name(match.group())
+            if phone and service:
+                break
+        phone = phone or "N/A"
+        service = service or "Unknown"
+        
+        return OTPMsg(
+            otp=otp,
+            phone=phone,
+            service=service,
+            timestamp=default_ts,
+            raw_message=text
+        )
     
     def _extract_phone_from_context(self, text, otp):
         """Extract phone number from context around OTP"""
@@ -260,7 +453,7 @@ class IVASMSScraper:
         otp_index = text.find(otp)
         if otp_index != -1:
             context = text[max(0, otp_index-100):otp_index+100]
-            phone_match = re.search(r'\+?\d{10,15}', context)
+            phone_match = _PHONE_RE.search(context)
             if phone_match:
                 return clean_phone_number(phone_match.group())
         return "N/A"
@@ -270,11 +463,10 @@ class IVASMSScraper:
         # Look for service names near the OTP
         otp_index = text.find(otp)
         if otp_index != -1:
-            context = text[max(0, otp_index-100):otp_index+100].lower()
-            services = ['facebook', 'google', 'instagram', 'twitter', 'whatsapp', 'telegram', 'discord']
-            for service in services:
-                if service in context:
-                    return clean_service_name(service)
+            context = text[max(0, otp_index-100):otp_index+100]
+            service_match = _SERVICE_RE.search(context)
+            if service_match:
+                return clean_service_name(service_match.group())
         return "Unknown"
     
     def test_connection(self):
@@ -307,7 +499,7 @@ def test_scraper():
         messages = scraper.fetch_messages()
         print(f"Found {len(messages)} messages")
         for msg in messages:
-            print(f"OTP: {msg['otp']}, Phone: {msg['phone']}, Service: {msg['service']}")
+            print(f"OTP: {msg.otp}, Phone: {msg.phone}, Service: {msg.service}")
     else:
         print("Failed to create scraper")
 
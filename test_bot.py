@@ -117,6 +117,22 @@ def test_bot_components():
             print("❌ utils.extract_otp_from_text failed")
             return False
         
+        # Long numbers after a keyword must not be cut down to an OTP
+        otp = extract_otp_from_text("Code 1234567890123")
+        if otp is None:
+            print("✅ utils.extract_otp_from_text ignores long numbers")
+        else:
+            print(f"❌ utils.extract_otp_from_text truncated a long number to {otp}")
+            return False
+        
+        # Longer bare codes win over shorter numbers earlier in the text
+        otp = extract_otp_from_text("Ref 2024: 567890 is your Facebook code")
+        if otp == '567890' and extract_otp_from_text("Use 7788 to verify. Balance 12345 Tk") == '12345':
+            print("✅ utils.extract_otp_from_text prefers longer codes")
+        else:
+            print(f"❌ utils.extract_otp_from_text picked {otp} over a longer code")
+            return False
+        
         # Test OTP filter
         from otp_filter import OTPFilter
         
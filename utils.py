@@ -1,39 +1,121 @@
+import html
 import re
+import threading
+import time
+from dataclasses import dataclass, field
 from datetime import datetime
+from operator import attrgetter
+from typing import Optional
+
+_OTP_FIELDS = attrgetter('otp', 'phone', 'service')
+
+# Codes labelled by a keyword, e.g. "code: 123456" or "OTP 4821"
+_OTP_KEYWORD_RE = re.compile(r'(?:code|verification|otp|pin)[:\s]*(\d{3,8})(?!\d)', re.IGNORECASE)
+# Bare 4 to 6-digit codes; the longest one found wins
+_OTP_BARE_RE = re.compile(r'\b(\d{6}|\d{5}|\d{4})\b')
+
+class _PhoneCharTable(dict):
+    """str.translate table that keeps digits and '+' and drops everything else"""
+    
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        # Remember each decision so repeated characters are plain lookups
+        keep = char if char == '+' or char.isdecimal() else None
+        self[codepoint] = keep
+        return keep
+
+_PHONE_TABLE = _PhoneCharTable()
+
+# Common service names, keyed by lowercase fragment
+_SERVICE_MAP = {
+    'fb': 'Facebook',
+    'google': 'Google',
+    'whatsapp': 'WhatsApp',
+    'telegram': 'Telegram',
+    'instagram': 'Instagram',
+    'twitter': 'Twitter',
+    'linkedin': 'LinkedIn',
+    'tiktok': 'TikTok',
+    'snapchat': 'Snapchat',
+    'discord': 'Discord'
+}
+
+# Message templates, filled in with str.format
+OTP_MESSAGE_TEMPLATE = """🔐 <b>New OTP Received</b>
+
+🔢 OTP: <code>{otp}</code>
+📱 Number: <code>{phone}</code>
+🌐 Service: <b>{service}</b>
+⏰ Time: {timestamp}
+
+<i>Tap the OTP to copy it!</i>"""
+
+STATUS_MESSAGE_TEMPLATE = """🤖 <b>Bot Status</b>
+
+⚡ Status: <b>Online</b>
+⏱️ Uptime: {uptime}
+📨 Total OTPs Sent: <b>{total_otps}</b>
+🔍 Last Check: {last_check}
+💾 Cache Size: {cache_size} items
+
+<i>Bot is running and monitoring for new OTPs</i>"""
+
+@dataclass(slots=True, frozen=True)
+class OTPMsg:
+    """A single OTP extracted from an SMS"""
+    otp: str
+    phone: str = 'N/A'
+    service: str = 'Unknown'
+    timestamp: Optional[str] = None
+    raw_message: str = ''
+    # Duplicate-filter key, built once; frozen fields keep it from going stale
+    key: tuple = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        object.__setattr__(self, 'key', (self.otp, self.phone, self.service))
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Build a message from a dict with the same keys; messages are returned as is"""
+        if isinstance(data, cls):
+            return data
+        return cls(
+            otp=data.get('otp', 'N/A'),
+            phone=data.get('phone', 'N/A'),
+            service=data.get('service', 'Unknown'),
+            timestamp=data.get('timestamp'),
+            raw_message=data.get('raw_message', '')
+        )
 
 def format_otp_message(otp_data):
     """
     Format OTP data for Telegram with touch-to-copy functionality
     
     Args:
-        otp_data (dict): Dictionary containing 'otp', 'phone', 'service', 'timestamp'
+        otp_data (OTPMsg or dict): Message, or dictionary containing 'otp', 'phone', 'service', 'timestamp'
     
     Returns:
         str: Formatted HTML message for Telegram
     """
-    otp = otp_data.get('otp', 'N/A')
-    phone = otp_data.get('phone', 'N/A')
-    service = otp_data.get('service', 'Unknown')
-    timestamp = otp_data.get('timestamp', datetime.now().strftime('%H:%M:%S'))
+    msg = OTPMsg.from_dict(otp_data)
+    timestamp = msg.timestamp
+    if timestamp is None:
+        timestamp = datetime.now().strftime('%H:%M:%S')
     
     # Format the message with HTML for touch-to-copy OTP
-    message = f"""🔐 <b>New OTP Received</b>
-
-🔢 OTP: <code>{otp}</code>
-📱 Number: <code>{phone}</code>
-🌐 Service: <b>{service}</b>
-⏰ Time: {timestamp}
-
-<i>Tap the OTP to copy it!</i>"""
-    
-    return message
+    return OTP_MESSAGE_TEMPLATE.format(
+        otp=msg.otp,
+        phone=msg.phone,
+        service=msg.service,
+        timestamp=timestamp
+    )
 
 def format_multiple_otps(otp_list):
     """
     Format multiple OTPs into a single message
     
     Args:
-        otp_list (list): List of OTP dictionaries
+        otp_list (list): List of OTPMsg objects or OTP dictionaries
     
     Returns:
         str: Formatted HTML message for Telegram
@@ -46,18 +128,14 @@ def format_multiple_otps(otp_list):
     
     header = f"🔐 <b>{len(otp_list)} New OTPs Received</b>\n\n"
     
-    messages = []
-    for i, otp_data in enumerate(otp_list, 1):
-        otp = otp_data.get('otp', 'N/A')
-        phone = otp_data.get('phone', 'N/A')
-        service = otp_data.get('service', 'Unknown')
-        
-        msg = f"<b>{i}.</b> <code>{otp}</code> | {service} | <code>{phone}</code>"
-        messages.append(msg)
+    body = "\n".join(
+        f"<b>{i}.</b> <code>{otp}</code> | {service} | <code>{phone}</code>"
+        for i, (otp, phone, service) in enumerate(map(_OTP_FIELDS, map(OTPMsg.from_dict, otp_list)), 1)
+    )
     
     footer = "\n\n<i>Tap any OTP to copy it!</i>"
     
-    return header + "\n".join(messages) + footer
+    return header + body + footer
 
 def extract_otp_from_text(text):
     """
@@ -72,23 +150,13 @@ def extract_otp_from_text(text):
     if not text:
         return None
     
-    # Common OTP patterns
-    patterns = [
-        r'\b(\d{6})\b',  # 6-digit codes
-        r'\b(\d{5})\b',  # 5-digit codes
-        r'\b(\d{4})\b',  # 4-digit codes
-        r'code[:\s]*(\d+)',  # "code: 123456"
-        r'verification[:\s]*(\d+)',  # "verification: 123456"
-        r'otp[:\s]*(\d+)',  # "otp: 123456"
-        r'pin[:\s]*(\d+)',  # "pin: 123456"
-    ]
+    # Labelled codes are the most reliable, so try them first
+    match = _OTP_KEYWORD_RE.search(text)
+    if match:
+        return match.group(1)
     
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            return match.group(1)
-    
-    return None
+    # Otherwise prefer 6, then 5, then 4-digit codes, as before
+    return max(_OTP_BARE_RE.findall(text), key=len, default=None)
 
 def clean_phone_number(phone):
     """
@@ -104,7 +172,7 @@ def clean_phone_number(phone):
         return "N/A"
     
     # Remove common prefixes and clean
-    cleaned = re.sub(r'[^\d+]', '', phone)
+    cleaned = phone.translate(_PHONE_TABLE)
     
     # Ensure it starts with +
     if cleaned and not cleaned.startswith('+'):
@@ -128,29 +196,20 @@ def clean_service_name(service):
     if not service:
         return "Unknown"
     
-    # Clean and capitalize
-    cleaned = service.strip().title()
-    
-    # Handle common service names
-    service_mappings = {
-        'fb': 'Facebook',
-        'google': 'Google',
-        'whatsapp': 'WhatsApp',
-        'telegram': 'Telegram',
-        'instagram': 'Instagram',
-        'twitter': 'Twitter',
-        'linkedin': 'LinkedIn',
-        'tiktok': 'TikTok',
-        'snapchat': 'Snapchat',
-        'discord': 'Discord'
-    }
-    
-    service_lower = cleaned.lower()
-    for key, value in service_mappings.items():
+    stripped = service.strip()
+    service_lower = stripped.lower()
+    
+    # Exact names first, then names embedded in longer text
+    mapped = _SERVICE_MAP.get(service_lower)
+    if mapped:
+        return mapped
+    
+    for key, value in _SERVICE_MAP.items():
         if key in service_lower:
             return value
     
-    return cleaned
+    # Clean and capitalize
+    return stripped.title()
 
 def sanitize_for_telegram(text):
     """
@@ -165,12 +224,8 @@ def sanitize_for_telegram(text):
     if not text:
         return ""
     
-    # Escape HTML characters
-    text = text.replace('&', '&amp;')
-    text = text.replace('<', '&lt;')
-    text = text.replace('>', '&gt;')
-    
-    return text
+    # Escape HTML characters in one pass
+    return html.escape(text, quote=False)
 
 def truncate_message(message, max_length=4096):
     """
@@ -189,6 +244,23 @@ def truncate_message(message, max_length=4096):
     truncated = message[:max_length - 50]
     return truncated + "\n\n<i>... (message truncated)</i>"
 
+def format_timestamp(ts, fmt='%Y-%m-%d %H:%M:%S', default='Never'):
+    """
+    Format an epoch timestamp for display
+    
+    Args:
+        ts (float): Seconds since the epoch, or None
+        fmt (str): strftime format
+        default (str): Text to return when ts is None
+    
+    Returns:
+        str: Formatted local time
+    """
+    if ts is None:
+        return default
+    
+    return time.strftime(fmt, time.localtime(ts))
+
 def get_status_message(stats):
     """
     Generate status message for bot health check
@@ -199,17 +271,40 @@ def get_status_message(stats):
     Returns:
         str: Formatted status message
     """
-    uptime = stats.get('uptime', 'Unknown')
-    total_otps = stats.get('total_otps_sent', 0)
-    last_check = stats.get('last_check', 'Never')
-    cache_size = stats.get('cache_size', 0)
-    
-    return f"""🤖 <b>Bot Status</b>
+    return STATUS_MESSAGE_TEMPLATE.format(
+        uptime=stats.get('uptime', 'Unknown'),
+        total_otps=stats.get('total_otps_sent', 0),
+        last_check=stats.get('last_check', 'Never'),
+        cache_size=stats.get('cache_size', 0)
+    )
 
-⚡ Status: <b>Online</b>
-⏱️ Uptime: {uptime}
-📨 Total OTPs Sent: <b>{total_otps}</b>
-🔍 Last Check: {last_check}
-💾 Cache Size: {cache_size} items
-
-<i>Bot is running and monitoring for new OTPs</i>"""
+class RateLimiter:
+    """Token bucket limiting how often an action may run"""
+    
+    def __init__(self, rate=30, capacity=None):
+        """
+        Args:
+            rate (float): Tokens added per second
+            capacity (int): Maximum burst size, defaults to rate
+        """
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a token is available, then consume it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                wait = (1 - self.tokens) / self.rate
+            
+            time.sleep(wait)